@@ -2,24 +2,55 @@ import argparse
 import asyncio
 import enum
 import functools
-import json
 import logging
-import pathlib
 import sys
 import typing
 
 from aiohttp import client, web
-from prometheus_async import aio
-from prometheus_client import Gauge
-from web3 import AsyncWeb3
-from web3.contract import AsyncContract
-from web3.eth import AsyncEth
-from web3.providers.rpc import AsyncHTTPProvider
+from eth_typing import ChecksumAddress
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client.core import GaugeMetricFamily, Metric
+from prometheus_client.registry import Collector
+
+if typing.TYPE_CHECKING:
+    # web3 takes about a second to import and is only needed to discover
+    # network at startup, so it is imported where used
+    from web3 import AsyncWeb3
 
 
 logger = logging.getLogger(__name__)
 
 
+# ############################
+# Supported Ethereum networks
+class SupportedNetworks(str, enum.Enum):
+    MAINNET = "mainnet"
+    HOLESKY = "holesky"
+
+    def __str__(self) -> str:
+        return self.value
+
+    def hyperlane_merkle_tree_hook_contract(self) -> ChecksumAddress:
+        return _HYPERLANE_MERKLE_TREE_HOOK_CONTRACTS[self]
+
+
+# See https://docs.hyperlane.xyz/docs/reference/contract-addresses#merkle-tree-hook
+_HYPERLANE_MERKLE_TREE_HOOK_CONTRACTS: dict[SupportedNetworks, ChecksumAddress] = {
+    SupportedNetworks.MAINNET: typing.cast(
+        ChecksumAddress, "0x48e6c30B97748d1e2e03bf3e9FbE3890ca5f8CCA"
+    ),
+    SupportedNetworks.HOLESKY: typing.cast(
+        ChecksumAddress, "0x98AAE089CaD930C64a76dD2247a2aC5773a4B8cE"
+    ),
+}
+
+
 # #############
 # Command line
 DEFAULT_INTERVAL_MS = 30000
@@ -28,9 +59,21 @@ arg_parser = argparse.ArgumentParser("Hyperlane network metrics exporter.")
 arg_parser.add_argument(
     "-e",
     "--ethereum-rpc",
-    help="Ethereum RPC base URL",
+    action="append",
+    help="Ethereum RPC base URL, repeat to export multiple networks",
     required=True,
 )
+arg_parser.add_argument(
+    "-n",
+    "--network",
+    type=SupportedNetworks,
+    choices=list(SupportedNetworks),
+    action="append",
+    help=(
+        "Ethereum network of RPC node, discovered from chain id if not set. "
+        "Repeat in the same order as --ethereum-rpc for multiple networks"
+    ),
+)
 arg_parser.add_argument(
     "-i",
     "--interval-ms",
@@ -46,33 +89,54 @@ arg_parser.add_argument(
 )
 
 
-# ############################
-# Supported Ethereum networks
-class SupportedNetworks(str, enum.Enum):
-    MAINNET = "mainnet"
-    HOLESKY = "holesky"
+# ########
+# Metrics
+# Dedicated registry, so scrapes only collect exporter's own metrics and do
+# not read process statistics from /proc every time
+registry = CollectorRegistry()
 
-    def __str__(self) -> str:
-        return self.value
 
-    def hyperlane_merkle_tree_hook_contract(self) -> str:
-        # See https://docs.hyperlane.xyz/docs/reference/contract-addresses#merkle-tree-hook
-        match self.value:
-            case SupportedNetworks.HOLESKY:
-                return "0x98AAE089CaD930C64a76dD2247a2aC5773a4B8cE"
-            case SupportedNetworks.MAINNET:
-                return "0x48e6c30B97748d1e2e03bf3e9FbE3890ca5f8CCA"
-        raise RuntimeError(
-            "Can not derive hyperlane merkle tree hook address for network"
-        )
+class NetworkValueCollector(Collector):
+    """Gauge of integer values per network, stored as is until scraped."""
 
+    def __init__(self, name: str, documentation: str) -> None:
+        self.name = name
+        self.documentation = documentation
+        self._values: dict[str, int] = {}
+        registry.register(self)
 
-# ########
-# Metrics
-hyperlane_contract_latest_checkpoint = Gauge(
+    def set(self, network: SupportedNetworks, value: int) -> None:
+        self._values[network.value] = value
+
+    def clear(self) -> None:
+        self._values.clear()
+
+    def collect(self) -> typing.Iterable[Metric]:
+        metric = GaugeMetricFamily(self.name, self.documentation, labels=["network"])
+        for network, value in self._values.items():
+            metric.add_metric([network], value)
+        yield metric
+
+
+hyperlane_contract_latest_checkpoint = NetworkValueCollector(
     name="hyperlane_contract_latest_checkpoint",
     documentation="Latest checkpoint acknowledged by Hyperlane contract",
-    labelnames=["network"],
+)
+hyperlane_ethereum_block_number = NetworkValueCollector(
+    name="hyperlane_ethereum_block_number",
+    documentation="Latest block number reported by Ethereum RPC node",
+)
+hyperlane_rpc_call_seconds = Histogram(
+    name="hyperlane_rpc_call_seconds",
+    documentation="Duration of requests to Ethereum RPC node",
+    labelnames=["network", "method"],
+    registry=registry,
+)
+hyperlane_rpc_errors = Counter(
+    name="hyperlane_rpc_errors",
+    documentation="Failed requests to Ethereum RPC node",
+    labelnames=["network", "method"],
+    registry=registry,
 )
 
 
@@ -80,7 +144,6 @@ hyperlane_contract_latest_checkpoint = Gauge(
 # Aiohttp & web3 apps
 async def start_exporter_app(app: web.Application) -> None:
     exporter: HyperlaneContractExporter = app[exporter_app_key]
-    await exporter.w3.provider.cache_async_session(exporter.session)  # type: ignore[attr-defined]
     await exporter.init()
     # Acquire data once to verify its working
     await exporter.tick()
@@ -92,63 +155,193 @@ async def stop_exporter_app(app: web.Application) -> None:
     await exporter.stop()
 
 
+async def metrics(request: web.Request) -> web.Response:
+    return web.Response(
+        body=generate_latest(registry), headers={"Content-Type": CONTENT_TYPE_LATEST}
+    )
+
+
 def get_application(exporter: "HyperlaneContractExporter") -> web.Application:
     app = web.Application()
     app[exporter_app_key] = exporter
-    app.router.add_get("/metrics", aio.web.server_stats)
+    app.router.add_get("/metrics", metrics)
     app.on_startup.append(start_exporter_app)
     app.on_shutdown.append(stop_exporter_app)
     return app
 
 
-def get_web3_provider(ethereum_rpc_url: str) -> AsyncWeb3:
+def get_web3_provider(ethereum_rpc_url: str) -> "AsyncWeb3":
+    from web3 import AsyncWeb3
+    from web3.eth import AsyncEth
+    from web3.providers.rpc import AsyncHTTPProvider
+
+    # Default middleware is meant for transaction signing and sending; for
+    # plain reads it only costs CPU, and the validation middleware issues an
+    # extra eth_chainId round-trip before every eth_call.
     return AsyncWeb3(
         provider=AsyncHTTPProvider(ethereum_rpc_url),
         modules={"eth": (AsyncEth,)},
+        middleware=[],
     )
 
 
-def get_hyperlane_merkle_tree_hook_contract_abi() -> typing.Any:
-    contents = (
-        pathlib.Path(__file__).parent / "contract/MerkleTreeHook.json"
-    ).read_text()
-    return json.loads(contents)
+# Selector of the argument-less `latestCheckpoint()` call, which returns
+# `(bytes32 root, uint32 index)` ABI-encoded into two 32 bytes words.
+# First 4 bytes of keccak(b"latestCheckpoint()")
+LATEST_CHECKPOINT_SELECTOR = "0x907c0f92"
 
 
-def get_hyperlane_merkle_tree_hook_contract(
-    web3: AsyncWeb3, network: SupportedNetworks
-) -> AsyncContract:
-    abi = get_hyperlane_merkle_tree_hook_contract_abi()
-    address = network.hyperlane_merkle_tree_hook_contract()
-    contract: AsyncContract = web3.eth.contract(address=address, abi=abi)  # type: ignore[call-overload]
-    return contract
+def decode_latest_checkpoint_index(result: str) -> int:
+    """Extract checkpoint index from hex encoded `latestCheckpoint()` result."""
+    # "0x" prefix, 64 hex digits of root, then index left-padded to 64 digits
+    if len(result) != 130 or not result.startswith("0x"):
+        raise RuntimeError(f"Unexpected latestCheckpoint() result: {result}")
+    return int(result[66:], 16)
 
 
-class HyperlaneContractExporter:
+class NetworkChecker:
+    """Fetches data for a single Ethereum network from its RPC node."""
 
     def __init__(
         self,
         rpc_address: str,
+        session: client.ClientSession,
+        *,
+        network: SupportedNetworks | None = None,
+    ):
+        self.rpc_address = rpc_address
+        self.session = session
+        self.configured_network = network
+
+    @functools.cached_property
+    def w3(self) -> "AsyncWeb3":
+        return get_web3_provider(self.rpc_address)
+
+    async def discover_network(self) -> SupportedNetworks:
+        # Resolve network from RPC
+        await self.w3.provider.cache_async_session(self.session)  # type: ignore[attr-defined]
+        chain_id = await self.w3.eth.chain_id
+        if chain_id == 1:
+            logger.info("Discovered Ethereum network as MAINNET")
+            return SupportedNetworks.MAINNET
+        elif chain_id == 17000:
+            logger.info("Discovered Ethereum network as HOLESKY")
+            return SupportedNetworks.HOLESKY
+        raise RuntimeError("Unsupported network with chain id %s", chain_id)
+
+    async def init(self) -> None:
+        if self.configured_network is None:
+            self.network = await self.discover_network()
+        else:
+            self.network = self.configured_network
+        # Network label does not change either, bind RPC metrics to it once.
+        # Error counter is exposed this way before first failure happens
+        self._rpc_call_seconds_metric = hyperlane_rpc_call_seconds.labels(
+            self.network, "batch"
+        )
+        self._rpc_errors_metric = hyperlane_rpc_errors.labels(self.network, "batch")
+        # Call parameters do not change between ticks, so build them once
+        self._latest_checkpoint_call = {
+            "to": self.network.hyperlane_merkle_tree_hook_contract(),
+            "data": LATEST_CHECKPOINT_SELECTOR,
+        }
+
+    async def rpc_batch(
+        self,
+        *requests: tuple[str, list[typing.Any]],
+        timeout: client.ClientTimeout | None = None,
+    ) -> list[typing.Any]:
+        """Send JSON-RPC requests in a single HTTP call, return results in order."""
+        payload = [
+            {"jsonrpc": "2.0", "id": request_id, "method": method, "params": params}
+            for request_id, (method, params) in enumerate(requests)
+        ]
+        with self._rpc_call_seconds_metric.time():
+            try:
+                async with self.session.post(
+                    self.rpc_address,
+                    json=payload,
+                    timeout=timeout if timeout is not None else self.session.timeout,
+                ) as response:
+                    response.raise_for_status()
+                    replies = await response.json()
+                if not isinstance(replies, list):
+                    raise RuntimeError(
+                        f"Unexpected response to batch request: {replies}"
+                    )
+                results: dict[int, typing.Any] = {}
+                for reply in replies:
+                    if "error" in reply:
+                        raise RuntimeError(f"RPC request failed: {reply['error']}")
+                    results[reply["id"]] = reply["result"]
+                if len(results) != len(requests):
+                    raise RuntimeError(
+                        f"Incomplete response to batch request: {replies}"
+                    )
+            except Exception:
+                self._rpc_errors_metric.inc()
+                raise
+        return [results[request_id] for request_id in range(len(requests))]
+
+    async def tick(self, timeout: client.ClientTimeout | None = None) -> None:
+        # Both values are fetched with a single round-trip to the RPC node
+        block_number, result = await self.rpc_batch(
+            ("eth_blockNumber", []),
+            ("eth_call", [self._latest_checkpoint_call, "latest"]),
+            timeout=timeout,
+        )
+        value = decode_latest_checkpoint_index(result)
+        logger.info(
+            "Fetched checkpoint index from %s contract: %s", self.network, value
+        )
+        hyperlane_contract_latest_checkpoint.set(self.network, value)
+        hyperlane_ethereum_block_number.set(self.network, int(block_number, 16))
+
+
+class HyperlaneContractExporter:
+
+    def __init__(
+        self,
+        rpc_addresses: list[str],
         interval_ms: int = DEFAULT_INTERVAL_MS,
         *,
         loop: asyncio.AbstractEventLoop,
+        networks: list[SupportedNetworks] | None = None,
     ):
-        self.rpc_address = rpc_address
+        if networks is not None and len(networks) != len(rpc_addresses):
+            raise ValueError("Networks must be given for each RPC address")
         self.interval_ms = interval_ms
         self.loop = loop
-        self.session = client.ClientSession(loop=loop)
-        self.w3 = get_web3_provider(self.rpc_address)
+        # Keep the RPC connection open between ticks: aiohttp closes idle
+        # connections after 15 seconds by default, which is shorter than the
+        # default interval and makes every tick pay for TCP & TLS handshakes.
+        connector = client.TCPConnector(
+            limit_per_host=4,
+            keepalive_timeout=max(60.0, self.interval_ms / 1000 * 3),
+            loop=loop,
+        )
+        self.session = client.ClientSession(connector=connector, loop=loop)
+        # Runner ticks that outlive an interval fail with TimeoutError, counted
+        # as RPC errors, so slow RPC can not make ticks pile up either. Startup
+        # tick keeps session defaults, as it also pays for DNS, TCP & TLS
+        self.tick_timeout = client.ClientTimeout(total=self.interval_ms / 1000)
+        self.checkers = [
+            NetworkChecker(
+                rpc_address,
+                self.session,
+                network=networks[index] if networks is not None else None,
+            )
+            for index, rpc_address in enumerate(rpc_addresses)
+        ]
         self.stopping = False
         self.stopped = asyncio.Event()
 
-    @functools.cached_property
-    def contract(self) -> AsyncContract:
-        return get_hyperlane_merkle_tree_hook_contract(self.w3, self.network)
-
     def on_runner_task_done(self, *args: typing.Any) -> None:
         self.stopped.set()
 
     def start(self) -> None:
+        # Startup tick has just been done, so the grid starts from now
+        self._next_tick_at = self.loop.time()
         self._runner_task = self.loop.create_task(self.run())
         # Raise event when task is stopped
         self._runner_task.add_done_callback(self.on_runner_task_done)
@@ -163,30 +356,39 @@ class HyperlaneContractExporter:
         logger.info("Stopped components, will exit")
 
     async def sleep(self) -> None:
-        await asyncio.sleep(self.interval_ms / 1000)
+        # Sleep until the next scheduled tick rather than for a whole interval,
+        # so time spent in tick does not stretch the sampling period. Slots
+        # missed during a stall are skipped instead of being caught up
+        self._next_tick_at += self.interval_ms / 1000
+        self._next_tick_at = max(self._next_tick_at, self.loop.time())
+        await asyncio.sleep(self._next_tick_at - self.loop.time())
 
     async def init(self) -> None:
-        # Resolve network from RPC
-        chain_id = await self.w3.eth.chain_id
-        if chain_id == 1:
-            logger.info("Discovered Ethereum network as MAINNET")
-            self.network = SupportedNetworks.MAINNET
-        elif chain_id == 17000:
-            logger.info("Discovered Ethereum network as HOLESKY")
-            self.network = SupportedNetworks.HOLESKY
-        else:
-            raise RuntimeError("Unsupported network with chain id %s", chain_id)
-
-    async def tick(self) -> None:
-        _, value = await self.contract.functions.latestCheckpoint().call()
-        logger.info("Fetched checkpoint index from contract: %s", value)
-        hyperlane_contract_latest_checkpoint.labels(self.network).set(value)
+        await asyncio.gather(*(checker.init() for checker in self.checkers))
+        networks = [checker.network for checker in self.checkers]
+        if len(set(networks)) != len(networks):
+            names = ", ".join(map(str, networks))
+            raise RuntimeError(f"Multiple RPC nodes serve same network: {names}")
+
+    async def tick(self, timeout: client.ClientTimeout | None = None) -> None:
+        # Networks are independent, so RPC nodes are queried concurrently and
+        # failure of one of them does not prevent updating the others
+        results = await asyncio.gather(
+            *(checker.tick(timeout) for checker in self.checkers),
+            return_exceptions=True,
+        )
+        errors = [result for result in results if isinstance(result, Exception)]
+        if errors:
+            raise ExceptionGroup("Failed to fetch data from RPC", errors)
 
     async def run(self) -> None:
-        """Infinite loop that spawns checker tasks."""
+        """Infinite loop that runs checker ticks one at a time."""
         while not self.stopping:
-            self.loop.create_task(self.tick())
             await self.sleep()
+            try:
+                await self.tick(self.tick_timeout)
+            except Exception:
+                logger.exception("Failed to fetch data from RPC")
         self.stopped.set()
 
 
@@ -197,9 +399,19 @@ exporter_app_key: web.AppKey[HyperlaneContractExporter] = web.AppKey(
 
 def main() -> None:
     args = arg_parser.parse_args()
-    loop = asyncio.new_event_loop()
+    if args.network is not None and len(args.network) != len(args.ethereum_rpc):
+        arg_parser.error("--network must be given for each --ethereum-rpc")
+    try:
+        import uvloop  # type: ignore[import-not-found, unused-ignore]
+    except ImportError:
+        loop = asyncio.new_event_loop()
+    else:
+        logger.info("Using uvloop event loop")
+        loop = uvloop.new_event_loop()
     asyncio.set_event_loop(loop)
-    exporter = HyperlaneContractExporter(args.ethereum_rpc, args.interval_ms, loop=loop)
+    exporter = HyperlaneContractExporter(
+        args.ethereum_rpc, args.interval_ms, loop=loop, networks=args.network
+    )
     app = get_application(exporter)
     web.run_app(
         app, host=args.host, port=args.port, loop=loop, handler_cancellation=True
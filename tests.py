@@ -1,29 +1,118 @@
 import asyncio
 from collections.abc import AsyncGenerator
 import socket
+import time
+import typing
 
 from aiohttp import client, web
+from eth_abi.abi import encode
+import prometheus_client
 from prometheus_client.parser import text_string_to_metric_families
 import pytest
 import pytest_asyncio
+from web3 import Web3
 
 import hyperlane_network_exporter
 
 
+MAINNET_RPC = (
+    "https://ethereum-rpc.publicnode.com",
+    hyperlane_network_exporter.SupportedNetworks.MAINNET,
+)
+HOLESKY_RPC = (
+    "https://ethereum-holesky-rpc.publicnode.com",
+    hyperlane_network_exporter.SupportedNetworks.HOLESKY,
+)
+
+
 def find_free_port() -> int:
     with socket.socket() as s:
         s.bind(("", 0))
         return int(s.getsockname()[1])
 
 
+def clear_metrics() -> None:
+    hyperlane_network_exporter.hyperlane_contract_latest_checkpoint.clear()
+    hyperlane_network_exporter.hyperlane_ethereum_block_number.clear()
+    hyperlane_network_exporter.hyperlane_rpc_call_seconds.clear()
+    hyperlane_network_exporter.hyperlane_rpc_errors.clear()
+
+
+class RPCStub:
+    """Local JSON-RPC node answering with canned results."""
+
+    def __init__(self, chain_id: str) -> None:
+        self.results = {
+            "eth_chainId": chain_id,
+            "eth_blockNumber": "0x10",
+            "eth_call": "0x" + "ab" * 32 + f"{12345:064x}",
+        }
+        self.methods: list[str] = []
+        self.url = ""
+        # Failure modes: reply with JSON-RPC error or never reply at all
+        self.failing: set[str] = set()
+        self.hanging = False
+        self.released = asyncio.Event()
+        # Seconds to wait before replying, e.g. to mimic cold connection
+        self.delay = 0.0
+
+    def reply(self, request: dict[str, typing.Any]) -> dict[str, typing.Any]:
+        self.methods.append(request["method"])
+        if request["method"] in self.failing:
+            return {
+                "jsonrpc": "2.0",
+                "id": request["id"],
+                "error": {"code": -32000, "message": "execution reverted"},
+            }
+        return {
+            "jsonrpc": "2.0",
+            "id": request["id"],
+            "result": self.results[request["method"]],
+        }
+
+    async def handle(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        await asyncio.sleep(self.delay)
+        if self.hanging:
+            await self.released.wait()
+        if isinstance(body, list):
+            return web.json_response([self.reply(item) for item in body])
+        return web.json_response(self.reply(body))
+
+
+@pytest.fixture
+def chain_id() -> str:
+    """Mainnet unless test parametrizes the chain id itself."""
+    return "0x1"
+
+
+@pytest_asyncio.fixture
+async def rpc_stub(chain_id: str) -> AsyncGenerator[RPCStub, None]:
+    stub = RPCStub(chain_id)
+    app = web.Application()
+    app.router.add_post("/", stub.handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    port = find_free_port()
+    site = web.TCPSite(runner, "localhost", port)
+    await site.start()
+    stub.url = f"http://localhost:{port}/"
+    yield stub
+    stub.released.set()
+    await runner.cleanup()
+    clear_metrics()
+
+
 @pytest_asyncio.fixture
 async def metrics_server(
-    rpc: tuple[str, hyperlane_network_exporter.SupportedNetworks],
-) -> AsyncGenerator[dict[str, str], None]:
+    rpcs: list[tuple[str, hyperlane_network_exporter.SupportedNetworks]],
+    configure_networks: bool,
+) -> AsyncGenerator[dict[str, typing.Any], None]:
     loop = asyncio.get_event_loop()
-    ethereum_rpc, network = rpc
     exporter = hyperlane_network_exporter.HyperlaneContractExporter(
-        ethereum_rpc, loop=loop
+        [ethereum_rpc for ethereum_rpc, _ in rpcs],
+        loop=loop,
+        networks=[network for _, network in rpcs] if configure_networks else None,
     )
     port = find_free_port()
     app = hyperlane_network_exporter.get_application(exporter)
@@ -33,38 +122,272 @@ async def metrics_server(
     await site.start()
     yield {
         "server": f"http://localhost:{port}",
-        "network": network,
+        "networks": {str(network) for _, network in rpcs},
     }
     await runner.shutdown()
     await site.stop()
-    hyperlane_network_exporter.hyperlane_contract_latest_checkpoint.clear()
+    clear_metrics()
 
 
 @pytest.mark.asyncio
 @pytest.mark.parametrize(
-    "rpc",
+    "rpcs",
     [
-        (
-            "https://ethereum-rpc.publicnode.com",
-            hyperlane_network_exporter.SupportedNetworks.MAINNET,
-        ),
-        (
-            "https://ethereum-holesky-rpc.publicnode.com",
-            hyperlane_network_exporter.SupportedNetworks.HOLESKY,
-        ),
+        [MAINNET_RPC],
+        [HOLESKY_RPC],
+        [MAINNET_RPC, HOLESKY_RPC],
     ],
 )
-async def test_metrics(metrics_server: dict[str, str]) -> None:
+@pytest.mark.parametrize("configure_networks", [False, True])
+async def test_metrics(metrics_server: dict[str, typing.Any]) -> None:
+    expected = {
+        "hyperlane_contract_latest_checkpoint",
+        "hyperlane_ethereum_block_number",
+        "hyperlane_rpc_call_seconds",
+        "hyperlane_rpc_errors",
+    }
     async with client.ClientSession() as session:
-        matched = False
+        matched = set()
         server_url = metrics_server["server"]
         response = await session.get(f"{server_url}/metrics")
         assert response.status == 200
         for metric in text_string_to_metric_families(await response.text()):
             if metric.name.startswith("hyperlane"):
-                assert metric.name == "hyperlane_contract_latest_checkpoint"
-                sample = metric.samples[0]
-                assert sample.labels["network"] == str(metrics_server["network"])
-                matched = True
+                assert metric.name in expected
+                networks = {sample.labels["network"] for sample in metric.samples}
+                assert networks == metrics_server["networks"]
+                matched.add(metric.name)
+
+    assert matched == expected
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "chain_id, network",
+    [
+        ("0x1", hyperlane_network_exporter.SupportedNetworks.MAINNET),
+        ("0x4268", hyperlane_network_exporter.SupportedNetworks.HOLESKY),
+    ],
+)
+@pytest.mark.parametrize("configure_network", [False, True])
+async def test_network_resolution(
+    rpc_stub: RPCStub,
+    network: hyperlane_network_exporter.SupportedNetworks,
+    configure_network: bool,
+) -> None:
+    exporter = hyperlane_network_exporter.HyperlaneContractExporter(
+        [rpc_stub.url],
+        loop=asyncio.get_running_loop(),
+        networks=[network] if configure_network else None,
+    )
+    try:
+        await exporter.init()
+        await exporter.tick()
+    finally:
+        await exporter.session.close()
+
+    (checker,) = exporter.checkers
+    assert checker.network == network
+    # Configured network must not need web3 nor chain id round-trip
+    assert ("w3" in vars(checker)) is not configure_network
+    assert ("eth_chainId" in rpc_stub.methods) is not configure_network
+    value = hyperlane_network_exporter.registry.get_sample_value(
+        "hyperlane_contract_latest_checkpoint", {"network": str(network)}
+    )
+    assert value == 12345
+
+
+@pytest.mark.asyncio
+async def test_networks_must_match_rpc_addresses() -> None:
+    with pytest.raises(ValueError):
+        hyperlane_network_exporter.HyperlaneContractExporter(
+            ["http://localhost:1/", "http://localhost:2/"],
+            loop=asyncio.get_running_loop(),
+            networks=[hyperlane_network_exporter.SupportedNetworks.MAINNET],
+        )
+
+
+def test_latest_checkpoint_selector() -> None:
+    selector = Web3.to_hex(Web3.keccak(text="latestCheckpoint()")[:4])
+    assert hyperlane_network_exporter.LATEST_CHECKPOINT_SELECTOR == selector
+
+
+@pytest.mark.parametrize("network", list(hyperlane_network_exporter.SupportedNetworks))
+def test_hyperlane_merkle_tree_hook_contract_is_checksummed(
+    network: hyperlane_network_exporter.SupportedNetworks,
+) -> None:
+    address = network.hyperlane_merkle_tree_hook_contract()
+    assert Web3.is_checksum_address(address)
+
+
+@pytest.mark.parametrize("index", [0, 1, 4321987, 2**32 - 1])
+def test_decode_latest_checkpoint_index(index: int) -> None:
+    root = bytes(range(32))
+    result = Web3.to_hex(encode(["bytes32", "uint32"], [root, index]))
+    assert hyperlane_network_exporter.decode_latest_checkpoint_index(result) == index
+
+
+@pytest.mark.parametrize("result", ["0x", "0x" + "00" * 32])
+def test_decode_latest_checkpoint_index_rejects_malformed(result: str) -> None:
+    with pytest.raises(RuntimeError):
+        hyperlane_network_exporter.decode_latest_checkpoint_index(result)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("failure", ["error", "timeout"])
+async def test_rpc_errors_are_counted(rpc_stub: RPCStub, failure: str) -> None:
+    network = hyperlane_network_exporter.SupportedNetworks.MAINNET
+    exporter = hyperlane_network_exporter.HyperlaneContractExporter(
+        [rpc_stub.url],
+        interval_ms=200,
+        loop=asyncio.get_running_loop(),
+        networks=[network],
+    )
+    if failure == "error":
+        rpc_stub.failing.add("eth_call")
+    else:
+        rpc_stub.hanging = True
+    try:
+        await exporter.init()
+        with pytest.raises(ExceptionGroup):
+            async with asyncio.timeout(5):
+                await exporter.tick(exporter.tick_timeout)
+    finally:
+        await exporter.session.close()
+
+    value = hyperlane_network_exporter.registry.get_sample_value(
+        "hyperlane_rpc_errors_total", {"network": str(network), "method": "batch"}
+    )
+    assert value == 1
+
+
+@pytest.mark.asyncio
+async def test_startup_tick_is_not_bound_by_interval(rpc_stub: RPCStub) -> None:
+    network = hyperlane_network_exporter.SupportedNetworks.MAINNET
+    exporter = hyperlane_network_exporter.HyperlaneContractExporter(
+        [rpc_stub.url],
+        interval_ms=100,
+        loop=asyncio.get_running_loop(),
+        networks=[network],
+    )
+    rpc_stub.delay = 0.3
+    try:
+        await exporter.init()
+        await exporter.tick()
+    finally:
+        await exporter.session.close()
+
+    value = hyperlane_network_exporter.registry.get_sample_value(
+        "hyperlane_contract_latest_checkpoint", {"network": str(network)}
+    )
+    assert value == 12345
+
+
+@pytest.mark.asyncio
+async def test_hanging_rpc_keeps_one_request_in_flight(
+    rpc_stub: RPCStub, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    exporter = hyperlane_network_exporter.HyperlaneContractExporter(
+        [rpc_stub.url],
+        interval_ms=50,
+        loop=asyncio.get_running_loop(),
+        networks=[hyperlane_network_exporter.SupportedNetworks.MAINNET],
+    )
+    (checker,) = exporter.checkers
+    rpc_batch = checker.rpc_batch
+    in_flight = []
+    peak = calls = 0
+
+    async def counting_rpc_batch(*args: typing.Any, **kwargs: typing.Any) -> typing.Any:
+        nonlocal peak, calls
+        calls += 1
+        in_flight.append(args)
+        peak = max(peak, len(in_flight))
+        try:
+            return await rpc_batch(*args, **kwargs)
+        finally:
+            in_flight.remove(args)
+
+    monkeypatch.setattr(checker, "rpc_batch", counting_rpc_batch)
+    await exporter.init()
+    rpc_stub.hanging = True
+    exporter.start()
+    await asyncio.sleep(0.3)
+    async with asyncio.timeout(1):
+        await exporter.stop()
+
+    assert exporter.session.closed
+    assert peak == 1
+    # Every interval a request was abandoned on timeout and a new one sent
+    assert calls > 1
+
+
+@pytest.mark.asyncio
+async def test_ticks_follow_interval_grid(
+    rpc_stub: RPCStub, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    interval = 0.1
+    loop = asyncio.get_running_loop()
+    exporter = hyperlane_network_exporter.HyperlaneContractExporter(
+        [rpc_stub.url],
+        interval_ms=int(interval * 1000),
+        loop=loop,
+        networks=[hyperlane_network_exporter.SupportedNetworks.MAINNET],
+    )
+    tick = exporter.tick
+    started: list[float] = []
+
+    async def recording_tick(*args: typing.Any) -> None:
+        started.append(loop.time())
+        await tick(*args)
+        if len(started) == 3:
+            # Stall whole event loop for several intervals
+            time.sleep(3.5 * interval)
+
+    monkeypatch.setattr(exporter, "tick", recording_tick)
+    await exporter.init()
+    # Latency of every tick would accumulate, if sleep did not account for it
+    rpc_stub.delay = 0.4 * interval
+    exporter.start()
+    grid_start = exporter._next_tick_at
+    await asyncio.sleep(9.5 * interval)
+    await exporter.stop()
+
+    # No extra tick right after the startup one, then ticks stay on the grid
+    for slot, tick_at in enumerate(started[:3], start=1):
+        assert tick_at - grid_start == pytest.approx(slot * interval, abs=0.03)
+    # Slots missed during the stall are skipped rather than fired back to back
+    gaps = [after - before for before, after in zip(started, started[1:])]
+    assert min(gaps) > interval - 0.03
+    assert len(started) > 4
+
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint_serves_only_exporter_metrics(
+    rpc_stub: RPCStub,
+) -> None:
+    exporter = hyperlane_network_exporter.HyperlaneContractExporter(
+        [rpc_stub.url], loop=asyncio.get_running_loop()
+    )
+    app = hyperlane_network_exporter.get_application(exporter)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    port = find_free_port()
+    site = web.TCPSite(runner, "localhost", port)
+    await site.start()
+    try:
+        async with client.ClientSession() as session:
+            response = await session.get(f"http://localhost:{port}/metrics")
+            assert response.status == 200
+            content_type = response.headers["Content-Type"]
+            families = {
+                metric.name
+                for metric in text_string_to_metric_families(await response.text())
+            }
+    finally:
+        await runner.cleanup()
 
-    assert matched
+    assert content_type == prometheus_client.CONTENT_TYPE_LATEST
+    assert "hyperlane_contract_latest_checkpoint" in families
+    for prefix in ("process_", "python_", "python_gc_"):
+        assert not any(name.startswith(prefix) for name in families)